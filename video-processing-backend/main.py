@@ -1,8 +1,9 @@
 import os
 import tempfile
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Depends
+import uuid
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Depends, Query
 from fastapi.responses import JSONResponse, FileResponse
-from typing import Optional
+from typing import List, Optional
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
@@ -10,8 +11,9 @@ import logging
 import json
 import time
 from celery.result import AsyncResult
-from tasks import process_video_task  # Import the Celery task
+from tasks import process_video_task, rerender_transcript_task, acquire_rerender_lock, release_rerender_lock  # Import the Celery tasks
 import redis
+from timeline import tokenize_query, find_phrase, decode_postings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,6 +32,9 @@ app.add_middleware(
 # Redis client for caching and rate limiting
 redis_client = redis.Redis(host='localhost', port=6379, db=0)
 
+# Each search term costs one index lookup over every video containing it
+MAX_SEARCH_TERMS = 16
+
 
 class ProcessingStatus(BaseModel):
     """
@@ -45,25 +50,74 @@ class ProcessingStatus(BaseModel):
     result_url: Optional[str] = None
 
 
-async def rate_limit(request: Request, times: int = 10, seconds: int = 60):
-    client_ip = request.client.host
-    key = f"ratelimit:{client_ip}:upload"
-    current = redis_client.get(key)
+class TranscriptWord(BaseModel):
+    """
+    A single word of a transcript segment with its timing in seconds.
+    """
+    word: str
+    start: float
+    end: float
 
-    if current is not None and int(current) >= times:
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
 
-    pipe = redis_client.pipeline()
-    pipe.incr(key)
-    pipe.expire(key, seconds)
-    pipe.execute()
+class TranscriptSegment(BaseModel):
+    """
+    A caption of the transcript.
+
+    Attributes:
+        start (float): When the caption appears, in seconds.
+        end (float): When the caption disappears, in seconds.
+        text (str): The caption text.
+        words (Optional[List[TranscriptWord]]): Word timings. If omitted, the stored timings are kept for a segment whose start, end and text are unchanged; otherwise they are spread evenly over the segment.
+    """
+    start: float
+    end: float
+    text: str
+    words: Optional[List[TranscriptWord]] = None
+
+
+class TranscriptEdit(BaseModel):
+    """
+    The full, edited list of transcript segments of a processed video.
+    """
+    segments: List[TranscriptSegment]
+
+
+def rate_limit(scope: str, times: int = 10, seconds: int = 60):
+    """
+    Build a dependency that limits each client IP to a number of requests per time window.
+
+    Args:
+        scope (str): The name of the budget, so different endpoints don't share one.
+        times (int): The number of requests allowed in the window.
+        seconds (int): The length of the window in seconds.
+
+    Returns:
+        The dependency, raising HTTPException 429 once the budget is used up.
+
+    Example:
+        >>> rate_limiter: None = Depends(rate_limit("upload"))
+    """
+    async def limiter(request: Request):
+        client_ip = request.client.host
+        key = f"ratelimit:{client_ip}:{scope}"
+        current = redis_client.get(key)
+
+        if current is not None and int(current) >= times:
+            raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+        pipe = redis_client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, seconds)
+        pipe.execute()
+
+    return limiter
 
 
 @app.post("/upload")
 async def upload_video(
     request: Request,
     file: UploadFile = File(...),
-    rate_limiter: None = Depends(rate_limit)
+    rate_limiter: None = Depends(rate_limit("upload"))
 ):
     """
     Upload a video file for processing.
@@ -166,3 +220,115 @@ async def download_video(filename: str):
     if os.path.exists(file_path):
         return FileResponse(file_path, media_type="video/mp4", filename=filename)
     raise HTTPException(status_code=404, detail="File not found")
+
+
+@app.put("/transcript/{folder_id}")
+async def edit_transcript(
+    folder_id: str,
+    edit: TranscriptEdit,
+    rate_limiter: None = Depends(rate_limit("transcript"))
+):
+    """
+    Update the transcript of a processed video and re-render only the captions that changed.
+
+    Args:
+        folder_id (str): The ID of the S3 folder holding the processed video.
+        edit (TranscriptEdit): The edited transcript segments.
+
+    Returns:
+        A JSON response with the task ID of the re-render, which can be polled with /status.
+
+    Raises:
+        HTTPException: 409 if a re-render of the same video is still running.
+
+    Example:
+        ```bash
+        curl -X PUT \
+        -H "Content-Type: application/json" \
+        -d '{"segments": [{"start": 0, "end": 2.5, "text": "Hello, world!"}]}' \
+        http://localhost:8000/transcript/1234567890
+        ```
+    """
+    previous_start = 0.0
+    for segment in edit.segments:
+        if segment.start < previous_start or segment.end <= segment.start:
+            raise HTTPException(status_code=400, detail="Segments must be in order and end after they start")
+        previous_start = segment.start
+
+    # Only one re-render per video at a time: each one overwrites the published video and render state
+    task_id = str(uuid.uuid4())
+    if not acquire_rerender_lock(folder_id, task_id):
+        raise HTTPException(status_code=409, detail="A re-render of this video is already running")
+
+    try:
+        task = rerender_transcript_task.apply_async(
+            args=[folder_id, [segment.model_dump() for segment in edit.segments]], task_id=task_id)
+    except Exception:
+        release_rerender_lock(folder_id, task_id)
+        raise
+    logger.info(f"Celery re-render task started with ID: {task.id}")
+
+    return JSONResponse(content={
+        "task_id": task.id,
+        "message": "Transcript update accepted. Re-rendering started.",
+        "folder_id": folder_id
+    }, status_code=200)
+
+
+@app.get("/search")
+async def search_transcripts(
+    q: str = Query(..., max_length=500),
+    limit: int = Query(50, ge=1, le=500),
+    rate_limiter: None = Depends(rate_limit("search", times=60))
+):
+    """
+    Search the transcripts of all processed videos for a phrase.
+
+    The videos containing every query term are found from the index keys first; postings are then read only
+    for those videos, in batches, until enough hits are found. No transcript is loaded.
+
+    Args:
+        q (str): The phrase to search for, of at most MAX_SEARCH_TERMS words. Case and punctuation are ignored.
+        limit (int): The maximum number of hits to return, between 1 and 500.
+
+    Returns:
+        A JSON response with the hits, ordered by folder ID and then by time, each with the folder ID of the
+        video and the start and end of the phrase in seconds, and whether more hits exist beyond the limit.
+
+    Example:
+        ```bash
+        curl -X GET \
+        "http://localhost:8000/search?q=hello%20world&limit=20"
+        ```
+    """
+    terms = tokenize_query(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Query must contain at least one word")
+    if len(terms) > MAX_SEARCH_TERMS:
+        raise HTTPException(status_code=400, detail=f"Query must contain at most {MAX_SEARCH_TERMS} words")
+
+    pipe = redis_client.pipeline()
+    for term in terms:
+        pipe.hkeys(f"search:term:{term}")
+    folder_ids = sorted(set.intersection(*(set(keys) for keys in pipe.execute())))
+
+    hits = []
+    batch_size = 100
+    for batch_start in range(0, len(folder_ids), batch_size):
+        batch = folder_ids[batch_start:batch_start + batch_size]
+        pipe = redis_client.pipeline()
+        for term in terms:
+            pipe.hmget(f"search:term:{term}", batch)
+        postings_by_term = pipe.execute()
+
+        for i, folder_id in enumerate(batch):
+            packed = [term_postings[i] for term_postings in postings_by_term]
+            if any(data is None for data in packed):
+                # Re-indexed between the two reads
+                continue
+            for start_ms, end_ms in find_phrase([decode_postings(data) for data in packed]):
+                hits.append({"folder_id": folder_id.decode('utf-8'), "start": start_ms / 1000, "end": end_ms / 1000})
+                if len(hits) > limit:
+                    return {"query": q, "hits": hits[:limit], "has_more": True}
+
+    return {"query": q, "hits": hits, "has_more": False}
@@ -7,11 +7,14 @@ import os
 import tempfile
 import ffmpeg
 import uuid
+import difflib
+from bisect import bisect_left, bisect_right
 import boto3
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
-from datetime import timedelta
 from dotenv import load_dotenv
 import json
+import redis
+from timeline import WordTimeline, InvertedIndex, normalize_segment, encode_postings, write_srt, write_vtt, write_json
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -24,6 +27,12 @@ s3obj = boto3.client("s3", aws_access_key_id = os.environ.get("AWS_ACCESS_KEY_ID
 
 celery_app = Celery('tasks', broker='redis://localhost:6379', backend='redis://localhost:6379')
 
+# Redis client holding the cross-video search index and the re-render locks
+redis_client = redis.Redis(host='localhost', port=6379, db=0)
+
+# Upper bound on a re-render, after which a lock left behind by a dead worker expires
+RERENDER_LOCK_SECONDS = 60 * 60
+
 @celery_app.task(bind=True)
 def process_video_task(self, video_path: str):
     """
@@ -39,6 +48,7 @@ def process_video_task(self, video_path: str):
         >>> process_video_task.apply_async(args=['path/to/video.mp4'])
     """
     logger.info(f"Starting video processing task for {video_path}")
+    transcriptfile = None
     try:
         audio_path = extract_audio(video_path)
         self.update_state(state='PROGRESS', meta={'status': 'Extracted audio', 'progress': 0.2})
@@ -48,111 +58,159 @@ def process_video_task(self, video_path: str):
         self.update_state(state='PROGRESS', meta={'status': 'Transcribed', 'progress': 0.5})
         logger.info("Transcription completed")
 
-        srt_content = generate_srt(transcript)
-        self.update_state(state='PROGRESS', meta={'status': 'SubRip Subtitle Made', 'progress': 0.8})
-        logger.info("SRT file generation completed")
+        timeline = WordTimeline.from_segments(transcript['segments'])
+        self.update_state(state='PROGRESS', meta={'status': 'Word Timeline Made', 'progress': 0.8})
+        logger.info(f"Word timeline built with {len(timeline)} words")
 
 
         final_video = add_captions_to_video(video_path, transcript, audio_path)
         logger.info(f"Video processing completed. Final video: {final_video}")
 
-        transcriptfile = create_srt_file(os.path.basename(final_video), srt_content)
+        transcriptfile = create_srt_file(os.path.basename(final_video), timeline)
         folder_id = uuid.uuid4()
         file_upload_to_s3(transcriptfile, os.environ.get("S3_BUCKET_NAME"), f"{folder_id}/{os.path.basename(transcriptfile)}", "txt", folder_id)
         file_upload_to_s3(final_video, os.environ.get("S3_BUCKET_NAME"), f"{folder_id}/{os.path.basename(final_video)}", "video", folder_id)
 
-        os.remove(transcriptfile)
+        # Keep the uncaptioned source and the segments so transcript edits can be re-rendered incrementally
+        file_upload_to_s3(video_path, os.environ.get("S3_BUCKET_NAME"), f"{folder_id}/render/source", "video", folder_id)
+        save_render_state(folder_id, {
+            'source_key': f"{folder_id}/render/source",
+            'video_key': f"{folder_id}/{os.path.basename(final_video)}",
+            'transcript_key': f"{folder_id}/{os.path.basename(transcriptfile)}",
+            'segments': [normalize_segment(segment) for segment in transcript['segments']]
+        })
+        publish_timeline(folder_id, timeline)
+
         return {'status': 'Completed', 'progress': 1.0, 'folder_id': f"{folder_id}"}
     
     except Exception as e:
         logger.error(f"Error in video processing task: {str(e)}", exc_info=True)
         return {'status': f"Error: {str(e)}", 'progress': 1.0}
+    finally:
+        if transcriptfile and os.path.exists(transcriptfile):
+            os.remove(transcriptfile)
 
-def extract_audio(video_path: str) -> str:
+@celery_app.task(bind=True)
+def rerender_transcript_task(self, folder_id: str, segments: list):
     """
-    Extract audio from a video file.
+    Apply edits to a stored transcript and re-render only the parts of the video whose captions changed.
 
-    Args:
-        video_path (str): The path to the video file.
+    The changed segments are widened to the surrounding keyframes of the published video, those ranges are
+    re-rendered from the uncaptioned source, and the untouched ranges are spliced back in with stream copy.
 
-    Returns:
-        str: The path to the extracted audio file.
+    Before the published video, transcript and render state are overwritten, they are copied under
+    {folder_id}/render/versions/{version}/ so the edit can be rolled back.
 
-    Example:
-        >>> audio_path = extract_audio('path/to/video.mp4')
-    """
-    logger.info(f"Starting audio extraction from {video_path}")
-    video = VideoFileClip(video_path)
-    audio_path = tempfile.mktemp(suffix='.wav')
-    video.audio.write_audiofile(audio_path)
-    logger.info(f"Audio extracted to {audio_path}")
-    return audio_path
-
-def timedelta_to_srt_time(td):
-    """
-    Convert a timedelta object to an SRT time string.
+    The caller must hold the re-render lock of the folder (see acquire_rerender_lock) under the task ID;
+    it is released when the task finishes.
 
     Args:
-        td (timedelta): The timedelta object to convert.
+        folder_id (str): The ID of the S3 folder holding the processed video.
+        segments (list): The edited transcript segments, each with 'start', 'end', 'text' and optionally 'words'.
 
     Returns:
-        str: The SRT time string.
+        dict: A dictionary containing the status of the task, progress, the new version, the S3 prefix of the previous
+        version, and the time ranges that were re-rendered.
 
     Example:
-        >>> timedelta_to_srt_time(timedelta(seconds=10))
-        '00:00:10,000'
+        >>> acquire_rerender_lock('1234', 'task-id')
+        >>> rerender_transcript_task.apply_async(args=['1234', [{'start': 0, 'end': 2.5, 'text': 'Hello, world!'}]], task_id='task-id')
     """
-    total_seconds = int(td.total_seconds())
-    hours, remainder = divmod(total_seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = int(td.microseconds / 1000)
-    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+    logger.info(f"Starting transcript re-render task for folder {folder_id}")
+    bucket_name = os.environ.get("S3_BUCKET_NAME")
+    source_path = video_path = final_video = transcriptfile = None
+    try:
+        state = load_render_state(folder_id)
+        new_segments = reuse_word_timings(state['segments'], segments)
+        changed_ranges = find_changed_ranges(state['segments'], new_segments)
+        if not changed_ranges:
+            logger.info("Transcript is unchanged, nothing to re-render")
+            return {'status': 'Completed', 'progress': 1.0, 'folder_id': folder_id, 'rerendered_ranges': []}
+        self.update_state(state='PROGRESS', meta={'status': 'Compared transcripts', 'progress': 0.1})
+
+        source_path = tempfile.mktemp(suffix='.mp4')
+        video_path = tempfile.mktemp(suffix='.mp4')
+        s3obj.download_file(bucket_name, state['source_key'], source_path)
+        s3obj.download_file(bucket_name, state['video_key'], video_path)
+        self.update_state(state='PROGRESS', meta={'status': 'Downloaded video', 'progress': 0.3})
+        logger.info("Source and published video downloaded")
+
+        duration = float(ffmpeg.probe(video_path)['format']['duration'])
+        ranges = snap_to_keyframes(changed_ranges, get_keyframe_times(video_path), duration)
+        final_video = splice_rerendered_ranges(source_path, video_path, new_segments, ranges)
+        self.update_state(state='PROGRESS', meta={'status': 'Re-rendered captions', 'progress': 0.8})
+        logger.info(f"Re-rendered {len(ranges)} range(s) of {duration:.2f}s video: {ranges}")
+
+        timeline = WordTimeline.from_segments(new_segments)
+        transcriptfile = create_srt_file(os.path.basename(state['video_key']), timeline)
+
+        # The uploads below overwrite the published files, so keep the current ones to roll back to
+        archived_version = archive_render_version(folder_id, state)
+        logger.info(f"Previous version archived under {archived_version}")
+
+        file_upload_to_s3(final_video, bucket_name, state['video_key'], "video", folder_id)
+        # Not uploaded as 'txt': the summary Lambda would recreate the DynamoDB item and drop its comments
+        file_upload_to_s3(transcriptfile, bucket_name, state['transcript_key'], "srt", folder_id)
+
+        state['segments'] = new_segments
+        state['version'] = state.get('version', 0) + 1
+        save_render_state(folder_id, state)
+        publish_timeline(folder_id, timeline)
+
+        return {'status': 'Completed', 'progress': 1.0, 'folder_id': folder_id, 'version': state['version'],
+                'previous_version': archived_version, 'rerendered_ranges': [[start, end] for start, end in ranges]}
 
-def generate_srt(transcription_data):
+    except Exception as e:
+        logger.error(f"Error in transcript re-render task: {str(e)}", exc_info=True)
+        return {'status': f"Error: {str(e)}", 'progress': 1.0}
+    finally:
+        for path in (transcriptfile, final_video, video_path, source_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+        release_rerender_lock(folder_id, self.request.id)
+
+def extract_audio(video_path: str) -> str:
     """
-    Generate an SRT file from transcription data.
+    Extract audio from a video file.
 
     Args:
-        transcription_data (dict): The transcription data.
+        video_path (str): The path to the video file.
 
     Returns:
-        str: The SRT file content.
+        str: The path to the extracted audio file.
 
     Example:
-        >>> transcription_data = {'segments': [{'start': 0, 'end': 10, 'text': 'Hello, world!'}]}
-        >>> srt_content = generate_srt(transcription_data)
+        >>> audio_path = extract_audio('path/to/video.mp4')
     """
-    logger.info("Starting SRT file generation")
-    srt_content = ""
-    for i, segment in enumerate(transcription_data['segments'], start=1):
-        start_time = timedelta(seconds=segment['start'])
-        end_time = timedelta(seconds=segment['end'])
-        
-        srt_content += f"{i}\n"
-        srt_content += f"{timedelta_to_srt_time(start_time)} --> {timedelta_to_srt_time(end_time)}\n"
-        srt_content += f"{segment['text'].strip()}\n\n"
-    
-    logger.info("SRT file generation completed")
-    return srt_content
+    logger.info(f"Starting audio extraction from {video_path}")
+    video = VideoFileClip(video_path)
+    audio_path = tempfile.mktemp(suffix='.wav')
+    video.audio.write_audiofile(audio_path)
+    logger.info(f"Audio extracted to {audio_path}")
+    return audio_path
 
-def create_srt_file(filename, data):
+def create_srt_file(filename, timeline: WordTimeline):
     """
-    Creates a new .txt file with the provided data and returns its path.
+    Creates a new .txt file holding the SubRip subtitles of a word timeline and returns its path.
+
+    The subtitles are streamed to the file cue by cue instead of being built up as one string.
 
     Args:
         filename (str): The name of the file to be created (without the extension).
-        data (str): The content to be written to the file.
+        timeline (WordTimeline): The word timeline of the transcript.
 
     Returns:
         str: The path to the newly created file.
 
     Example:
-        >>> create_srt_file("example", "Hello, World!")
+        >>> create_srt_file("example", WordTimeline.from_segments(transcription['segments']))
         '/path/to/current/directory/example.txt'
     """
+    logger.info("Starting SRT file generation")
     filename = os.path.splitext(filename)[0]
     with open(f"{filename}.txt", 'w') as file:
-        file.write(data)
+        write_srt(timeline, file)
+    logger.info("SRT file generation completed")
     return os.path.join(os.getcwd(), f"{filename}.txt")
 
 def file_upload_to_s3(file_path: str, bucket_name: str, s3_key: str, type: str, folder_id: str) -> str:
@@ -296,6 +354,94 @@ def generate_transcript(audio_path: str):
         logger.error(f"Error in transcription: {str(e)}", exc_info=True)
         raise ValueError(f"Could not request results from Speech Recognition service: {e}")
 
+def draw_caption(frame, segment: dict, current_time: float, width: int, height: int):
+    """
+    Draw a transcript segment onto a video frame, highlighting the word being spoken.
+
+    Args:
+        frame (numpy.ndarray): The frame to draw on. It is modified in place.
+        segment (dict): The transcript segment with its 'text' and 'words'.
+        current_time (float): The timestamp of the frame in seconds.
+        width (int): The width of the frame.
+        height (int): The height of the frame.
+
+    Example:
+        >>> draw_caption(frame, transcription['segments'][0], 1.5, 1280, 720)
+    """
+    text = segment['text']
+    font_scale = get_optimal_font_scale(text, width)
+    
+    (total_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_DUPLEX, font_scale, 1)
+    text_x = (width - total_width) // 2
+    text_y = height - 50
+
+    cv2.rectangle(frame, (text_x - 10, text_y - text_height - 10),
+                  (text_x + total_width + 10, text_y + 10), (0, 0, 0), -1)
+    
+    x = text_x
+    for word in segment['words']:
+        word_text = word['word']
+        (word_width, _), _ = cv2.getTextSize(word_text, cv2.FONT_HERSHEY_DUPLEX, font_scale, 1)
+        
+        if word['start'] <= current_time < word['end']:
+            cv2.putText(frame, word_text, (x, text_y), cv2.FONT_HERSHEY_DUPLEX,
+                        font_scale, (255, 255, 0), 1, cv2.LINE_AA)
+        else:
+            cv2.putText(frame, word_text, (x, text_y), cv2.FONT_HERSHEY_DUPLEX,
+                        font_scale, (255, 255, 255), 1, cv2.LINE_AA)
+        
+        x += word_width + 5
+
+def render_captioned_frames(cap, out, segments: list, fps: int, width: int, height: int,
+                            start_frame: int = 0, end_frame: int = None) -> int:
+    """
+    Read frames from a video capture, burn the active caption into each one and write them out.
+
+    Args:
+        cap (cv2.VideoCapture): The opened source video.
+        out (cv2.VideoWriter): The writer receiving the captioned frames.
+        segments (list): The transcript segments, ordered by start time.
+        fps (int): The frame rate used to map frame numbers to timestamps.
+        width (int): The width of the frames.
+        height (int): The height of the frames.
+        start_frame (int): The first frame to render.
+        end_frame (int): The frame to stop before, or None to render until the end of the video.
+
+    Returns:
+        int: The number of frames written.
+
+    Example:
+        >>> render_captioned_frames(cap, out, transcription['segments'], 30, 1280, 720, 300, 450)
+        150
+    """
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    frame_count = start_frame
+    current_segment_index = 0
+    while (current_segment_index < len(segments)
+           and segments[current_segment_index]['end'] <= start_frame / fps):
+        current_segment_index += 1
+    
+    while cap.isOpened() and (end_frame is None or frame_count < end_frame):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        
+        current_time = frame_count / fps
+        
+        if current_segment_index < len(segments):
+            segment = segments[current_segment_index]
+            if segment['start'] <= current_time < segment['end']:
+                draw_caption(frame, segment, current_time, width, height)
+            elif current_time >= segment['end']:
+                current_segment_index += 1
+        
+        out.write(frame)
+        frame_count += 1
+
+    return frame_count - start_frame
+
 def add_captions_to_video(video_path: str, transcription: object, audio_path: str) -> str:
     """
     Add captions to a video file using a transcription result.
@@ -328,48 +474,7 @@ def add_captions_to_video(video_path: str, transcription: object, audio_path: st
     output_path = video_path.rsplit('.', 1)[0] + '_captioned.mp4'
     out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
     
-    frame_count = 0
-    current_segment_index = 0
-    
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        current_time = frame_count / fps
-        
-        if current_segment_index < len(transcription['segments']):
-            segment = transcription['segments'][current_segment_index]
-            if segment['start'] <= current_time < segment['end']:
-                text = segment['text']
-                font_scale = get_optimal_font_scale(text, width)
-                
-                (total_width, text_height), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_DUPLEX, font_scale, 1)
-                text_x = (width - total_width) // 2
-                text_y = height - 50
-
-                cv2.rectangle(frame, (text_x - 10, text_y - text_height - 10),
-                              (text_x + total_width + 10, text_y + 10), (0, 0, 0), -1)
-                
-                x = text_x
-                for word in segment['words']:
-                    word_text = word['word']
-                    (word_width, _), _ = cv2.getTextSize(word_text, cv2.FONT_HERSHEY_DUPLEX, font_scale, 1)
-                    
-                    if word['start'] <= current_time < word['end']:
-                        cv2.putText(frame, word_text, (x, text_y), cv2.FONT_HERSHEY_DUPLEX,
-                                    font_scale, (255, 255, 0), 1, cv2.LINE_AA)
-                    else:
-                        cv2.putText(frame, word_text, (x, text_y), cv2.FONT_HERSHEY_DUPLEX,
-                                    font_scale, (255, 255, 255), 1, cv2.LINE_AA)
-                    
-                    x += word_width + 5
-                
-            elif current_time >= segment['end']:
-                current_segment_index += 1
-        
-        out.write(frame)
-        frame_count += 1
+    render_captioned_frames(cap, out, transcription['segments'], fps, width, height)
     
     cap.release()
     out.release()
@@ -388,3 +493,401 @@ def add_captions_to_video(video_path: str, transcription: object, audio_path: st
     os.remove(audio_path)
 
     return final_output_path
+
+def acquire_rerender_lock(folder_id: str, task_id: str) -> bool:
+    """
+    Take the re-render lock of a processed video so that only one re-render overwrites it at a time.
+
+    Args:
+        folder_id (str): The ID of the S3 folder holding the processed video.
+        task_id (str): The ID of the re-render task that will hold the lock.
+
+    Returns:
+        bool: True if the lock was taken, False if another re-render holds it.
+
+    Example:
+        >>> acquire_rerender_lock('1234', 'task-id')
+        True
+    """
+    return bool(redis_client.set(f"rerender:lock:{folder_id}", task_id, nx=True, ex=RERENDER_LOCK_SECONDS))
+
+def release_rerender_lock(folder_id: str, task_id: str):
+    """
+    Release the re-render lock of a processed video if it is still held by the given task.
+
+    Args:
+        folder_id (str): The ID of the S3 folder holding the processed video.
+        task_id (str): The ID of the re-render task holding the lock.
+
+    Example:
+        >>> release_rerender_lock('1234', 'task-id')
+    """
+    # Compare and delete atomically, so an expired lock since taken by another task is left alone
+    redis_client.eval(
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0",
+        1, f"rerender:lock:{folder_id}", task_id
+    )
+
+def save_render_state(folder_id: str, state: dict):
+    """
+    Store the render state of a processed video (S3 keys and transcript segments) next to the video in S3.
+
+    Args:
+        folder_id (str): The ID of the S3 folder holding the processed video.
+        state (dict): The render state to store.
+
+    Example:
+        >>> save_render_state('1234', {'source_key': '1234/render/source', 'segments': []})
+    """
+    s3obj.put_object(
+        Bucket=os.environ.get("S3_BUCKET_NAME"),
+        Key=f"{folder_id}/render/state.json",
+        Body=json.dumps(state),
+        ContentType="application/json"
+    )
+
+def archive_render_version(folder_id: str, state: dict) -> str:
+    """
+    Copy the published video, transcript and render state of a processed video to a versioned prefix.
+
+    The copies have no file extensions, so the frontend keeps picking the published .mp4 and .txt of the folder.
+
+    Args:
+        folder_id (str): The ID of the S3 folder holding the processed video.
+        state (dict): The current render state; its 'version' (0 if unset) names the archive.
+
+    Returns:
+        str: The S3 prefix the version was archived under.
+
+    Example:
+        >>> archive_render_version('1234', load_render_state('1234'))
+        '1234/render/versions/0'
+    """
+    bucket_name = os.environ.get("S3_BUCKET_NAME")
+    prefix = f"{folder_id}/render/versions/{state.get('version', 0)}"
+    s3obj.copy({'Bucket': bucket_name, 'Key': state['video_key']}, bucket_name, f"{prefix}/video")
+    s3obj.copy({'Bucket': bucket_name, 'Key': state['transcript_key']}, bucket_name, f"{prefix}/transcript")
+    s3obj.put_object(
+        Bucket=bucket_name,
+        Key=f"{prefix}/state.json",
+        Body=json.dumps(state),
+        ContentType="application/json"
+    )
+    return prefix
+
+def load_render_state(folder_id: str) -> dict:
+    """
+    Load the render state of a processed video from S3.
+
+    Args:
+        folder_id (str): The ID of the S3 folder holding the processed video.
+
+    Returns:
+        dict: The render state stored by save_render_state.
+
+    Raises:
+        ValueError: If the video was processed before render state was kept.
+
+    Example:
+        >>> state = load_render_state('1234')
+    """
+    try:
+        response = s3obj.get_object(Bucket=os.environ.get("S3_BUCKET_NAME"), Key=f"{folder_id}/render/state.json")
+    except s3obj.exceptions.NoSuchKey as e:
+        raise ValueError(f"No render state stored for folder {folder_id}") from e
+    return json.loads(response['Body'].read())
+
+def _segment_timing_key(segment: dict) -> tuple:
+    return (round(float(segment['start']) * 1000), round(float(segment['end']) * 1000), segment['text'].strip())
+
+def reuse_word_timings(stored_segments: list, segments: list) -> list:
+    """
+    Normalize edited segments, keeping the stored word timings of every segment the edit left untouched.
+
+    A segment sent without words whose start, end (to the millisecond) and text match a stored segment gets that
+    segment's words back, so only captions whose text changed have their word timings rebuilt.
+
+    Args:
+        stored_segments (list): The segments the published video was rendered with.
+        segments (list): The edited segments, each with 'start', 'end', 'text' and optionally 'words'.
+
+    Returns:
+        list: The normalized edited segments.
+
+    Example:
+        >>> stored = [normalize_segment({'start': 0, 'end': 2, 'text': ' Hi there'}),
+        ...           normalize_segment({'start': 2, 'end': 4, 'text': ' Helo world'}),
+        ...           normalize_segment({'start': 4, 'end': 6, 'text': ' Bye now'})]
+        >>> edited = [{'start': 0, 'end': 2, 'text': 'Hi there'},
+        ...           {'start': 2, 'end': 4, 'text': 'Hello world'},
+        ...           {'start': 4, 'end': 6, 'text': 'Bye now'}]
+        >>> find_changed_ranges(stored, reuse_word_timings(stored, edited))
+        [(2.0, 4.0)]
+    """
+    stored_words = {_segment_timing_key(segment): segment['words'] for segment in stored_segments}
+    merged = []
+    for segment in segments:
+        if not segment.get('words') and _segment_timing_key(segment) in stored_words:
+            segment = {**segment, 'words': stored_words[_segment_timing_key(segment)]}
+        merged.append(normalize_segment(segment))
+    return merged
+
+def find_changed_ranges(old_segments: list, new_segments: list) -> list:
+    """
+    Find the time ranges whose captions differ between two versions of a transcript.
+
+    Args:
+        old_segments (list): The segments the published video was rendered with.
+        new_segments (list): The edited segments.
+
+    Returns:
+        list: (start, end) tuples in seconds, covering both the old and the new timing of each changed run of segments.
+
+    Example:
+        >>> find_changed_ranges([{'start': 0, 'end': 2, 'text': 'Helo', 'words': []}],
+        ...                     [{'start': 0, 'end': 2, 'text': 'Hello', 'words': []}])
+        [(0, 2)]
+    """
+    def segment_key(segment):
+        words = tuple((word['word'], round(word['start'] * 1000), round(word['end'] * 1000)) for word in segment['words'])
+        return _segment_timing_key(segment) + (words,)
+
+    matcher = difflib.SequenceMatcher(a=[segment_key(segment) for segment in old_segments],
+                                      b=[segment_key(segment) for segment in new_segments],
+                                      autojunk=False)
+    ranges = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        changed = old_segments[i1:i2] + new_segments[j1:j2]
+        ranges.append((min(segment['start'] for segment in changed), max(segment['end'] for segment in changed)))
+    return ranges
+
+def get_keyframe_times(video_path: str) -> list:
+    """
+    List the keyframe timestamps of the first video stream, read from packet flags without decoding.
+
+    Args:
+        video_path (str): The path to the video file.
+
+    Returns:
+        list: The keyframe timestamps in seconds, sorted.
+
+    Example:
+        >>> get_keyframe_times('path/to/video.mp4')
+        [0.0, 8.333, 16.667]
+    """
+    probe = ffmpeg.probe(video_path, select_streams='v:0', show_packets=None, show_entries='packet=pts_time,flags')
+    return sorted(float(packet['pts_time']) for packet in probe.get('packets', [])
+                  if 'K' in packet.get('flags', '') and packet.get('pts_time', 'N/A') != 'N/A')
+
+def snap_to_keyframes(ranges: list, keyframes: list, duration: float) -> list:
+    """
+    Widen time ranges out to the surrounding keyframes and merge the ones that overlap.
+
+    Args:
+        ranges (list): (start, end) tuples in seconds.
+        keyframes (list): The sorted keyframe timestamps of the video.
+        duration (float): The duration of the video in seconds.
+
+    Returns:
+        list: Sorted, non-overlapping (start, end) tuples that begin on a keyframe and end on the next one (or the end of the video).
+
+    Example:
+        >>> snap_to_keyframes([(3.2, 4.1)], [0.0, 2.0, 5.0], 10.0)
+        [(2.0, 5.0)]
+    """
+    snapped = []
+    for start, end in sorted(ranges):
+        i = bisect_right(keyframes, max(start, 0.0)) - 1
+        j = bisect_left(keyframes, end)
+        start = keyframes[i] if i >= 0 else 0.0
+        end = keyframes[j] if j < len(keyframes) else duration
+        if snapped and start <= snapped[-1][1]:
+            snapped[-1] = (snapped[-1][0], max(snapped[-1][1], end))
+        elif start < end:
+            snapped.append((start, end))
+    return snapped
+
+def copy_video_range(video_path: str, start: float, end: float, timescale: int) -> str:
+    """
+    Cut a keyframe-aligned range out of a video with stream copy.
+
+    Args:
+        video_path (str): The path to the video file.
+        start (float): The keyframe to start at, in seconds.
+        end (float): The keyframe to stop before, in seconds, or None to copy until the end of the video.
+        timescale (int): The video track timescale, so the piece can be concatenated with the others.
+
+    Returns:
+        str: The path to the copied piece.
+
+    Example:
+        >>> piece_path = copy_video_range('path/to/video.mp4', 0.0, 8.333, 15360)
+    """
+    piece_path = tempfile.mktemp(suffix='.mp4')
+    output_args = {'c': 'copy', 'avoid_negative_ts': 'make_zero', 'video_track_timescale': timescale}
+    if end is not None:
+        output_args['t'] = end - start
+    ffmpeg.input(video_path, ss=start).output(piece_path, **output_args).run(overwrite_output=True)
+    return piece_path
+
+def render_video_range(cap, video_path: str, segments: list, start: float, end: float, fps: int,
+                       width: int, height: int, video_stream: dict, timescale: int) -> str:
+    """
+    Re-render a keyframe-aligned range of the published video from the uncaptioned source.
+
+    The video is encoded with the codec and pixel format of the published video, and its audio is stream copied.
+
+    Args:
+        cap (cv2.VideoCapture): The opened uncaptioned source video.
+        video_path (str): The path to the published video, used for its audio.
+        segments (list): The transcript segments to burn in.
+        start (float): The start of the range in seconds.
+        end (float): The end of the range in seconds.
+        fps (int): The frame rate used when the video was first rendered.
+        width (int): The width of the frames.
+        height (int): The height of the frames.
+        video_stream (dict): The ffprobe description of the published video stream.
+        timescale (int): The video track timescale, so the piece can be concatenated with the others.
+
+    Returns:
+        str: The path to the rendered piece.
+
+    Example:
+        >>> piece_path = render_video_range(cap, 'path/to/video.mp4', segments, 8.333, 16.667, 30, 1280, 720, stream, 15360)
+    """
+    frames_path = tempfile.mktemp(suffix='.mp4')
+    out = cv2.VideoWriter(frames_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    render_captioned_frames(cap, out, segments, fps, width, height, round(start * fps), round(end * fps))
+    out.release()
+
+    piece_path = tempfile.mktemp(suffix='.mp4')
+    video = ffmpeg.input(frames_path).video
+    audio = ffmpeg.input(video_path, ss=start, t=end - start).audio
+    ffmpeg.output(video, audio, piece_path, vcodec=video_stream['codec_name'], pix_fmt=video_stream['pix_fmt'],
+                  acodec='copy', r=fps, video_track_timescale=timescale).run(overwrite_output=True)
+    os.remove(frames_path)
+    return piece_path
+
+def splice_rerendered_ranges(source_path: str, video_path: str, segments: list, ranges: list) -> str:
+    """
+    Rebuild the published video by re-rendering the given ranges and stream copying everything in between.
+
+    Args:
+        source_path (str): The path to the uncaptioned source video.
+        video_path (str): The path to the published captioned video.
+        segments (list): The transcript segments to burn in.
+        ranges (list): Sorted, non-overlapping keyframe-aligned (start, end) tuples to re-render.
+
+    Returns:
+        str: The path to the spliced video.
+
+    Example:
+        >>> final_video = splice_rerendered_ranges('path/to/source.mp4', 'path/to/video.mp4', segments, [(8.333, 16.667)])
+    """
+    probe = ffmpeg.probe(video_path)
+    video_stream = next(stream for stream in probe['streams'] if stream['codec_type'] == 'video')
+    timescale = int(video_stream['time_base'].split('/')[1])
+    duration = float(probe['format']['duration'])
+
+    cap = cv2.VideoCapture(source_path)
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    pieces = []
+    list_path = tempfile.mktemp(suffix='.txt')
+    try:
+        position = 0.0
+        for start, end in ranges:
+            if start > position:
+                pieces.append(copy_video_range(video_path, position, start, timescale))
+            pieces.append(render_video_range(cap, video_path, segments, start, end, fps,
+                                             width, height, video_stream, timescale))
+            position = end
+        if duration - position > 1 / fps:
+            pieces.append(copy_video_range(video_path, position, None, timescale))
+
+        with open(list_path, 'w') as file:
+            for piece in pieces:
+                file.write(f"file '{piece}'\n")
+
+        output_path = f"{video_path.rsplit('.', 1)[0]}_spliced.mp4"
+        ffmpeg.input(list_path, format='concat', safe=0).output(output_path, c='copy').run(overwrite_output=True)
+        logger.info(f"Spliced {len(pieces)} pieces into {output_path}")
+        return output_path
+    finally:
+        cap.release()
+        for piece in pieces:
+            os.remove(piece)
+        if os.path.exists(list_path):
+            os.remove(list_path)
+
+def publish_timeline(folder_id: str, timeline: WordTimeline):
+    """
+    Upload the word timeline artifacts of a processed video and add its words to the search index.
+
+    The artifacts are stored under {folder_id}/timeline/: the memory-mappable timeline (words.bin) and
+    inverted index (index.bin), plus WebVTT captions (captions.vtt) and the words as JSON (words.json).
+
+    These are secondary artifacts published after the video is live, so a failure is logged rather than raised.
+
+    Args:
+        folder_id (str): The ID of the S3 folder holding the processed video.
+        timeline (WordTimeline): The word timeline of the transcript.
+
+    Example:
+        >>> publish_timeline('1234', WordTimeline.from_segments(transcription['segments']))
+    """
+    logger.info(f"Publishing word timeline for folder {folder_id}")
+    bucket_name = os.environ.get("S3_BUCKET_NAME")
+    artifact_dir = tempfile.mkdtemp()
+    artifacts = {name: os.path.join(artifact_dir, name) for name in ('words.bin', 'index.bin', 'captions.vtt', 'words.json')}
+    try:
+        index = InvertedIndex.from_timeline(timeline)
+        timeline.save(artifacts['words.bin'])
+        index.save(artifacts['index.bin'])
+        with open(artifacts['captions.vtt'], 'w') as file:
+            write_vtt(timeline, file)
+        with open(artifacts['words.json'], 'w') as file:
+            write_json(timeline, file)
+
+        for name, path in artifacts.items():
+            file_upload_to_s3(path, bucket_name, f"{folder_id}/timeline/{name}", "timeline", folder_id)
+
+        index_timeline(folder_id, index)
+        logger.info(f"Word timeline published: {len(timeline)} words, {len(index)} terms")
+    except Exception as e:
+        logger.error(f"Error publishing word timeline for folder {folder_id}: {str(e)}", exc_info=True)
+    finally:
+        for path in artifacts.values():
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(artifact_dir)
+
+def index_timeline(folder_id: str, index: InvertedIndex):
+    """
+    Replace the postings of a video in the cross-video search index kept in Redis.
+
+    Each term has a hash search:term:{term} mapping folder IDs to the postings of that term, packed with
+    encode_postings, and search:terms:{folder_id} remembers the terms of a video so stale postings can be dropped.
+
+    Args:
+        folder_id (str): The ID of the S3 folder holding the processed video.
+        index (InvertedIndex): The inverted index of the video's transcript.
+
+    Example:
+        >>> index_timeline('1234', InvertedIndex.from_timeline(timeline))
+    """
+    folder_id = str(folder_id)
+    old_terms = redis_client.smembers(f"search:terms:{folder_id}")
+
+    pipe = redis_client.pipeline()
+    for term in old_terms:
+        pipe.hdel(f"search:term:{term.decode('utf-8')}", folder_id)
+    pipe.delete(f"search:terms:{folder_id}")
+    for term, postings in index.items():
+        pipe.hset(f"search:term:{term}", folder_id, encode_postings(postings))
+        pipe.sadd(f"search:terms:{folder_id}", term)
+    pipe.execute()
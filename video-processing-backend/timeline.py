@@ -0,0 +1,541 @@
+import json
+import re
+import struct
+import numpy as np
+
+TIMELINE_MAGIC = b"TBWT"
+INDEX_MAGIC = b"TBIX"
+FORMAT_VERSION = 1
+
+
+def normalize_segment(segment: dict) -> dict:
+    """
+    Reduce a transcript segment to the fields needed for rendering, rebuilding word timings if the text was edited.
+
+    When the words no longer spell out the segment text, the segment duration is split evenly across the new words.
+
+    Args:
+        segment (dict): The transcript segment with 'start', 'end', 'text' and optionally 'words'.
+
+    Returns:
+        dict: The segment with only 'start', 'end', 'text' and 'words'.
+
+    Example:
+        >>> normalize_segment({'start': 0, 'end': 2, 'text': ' Hello world'})
+        {'start': 0.0, 'end': 2.0, 'text': ' Hello world', 'words': [{'word': ' Hello', 'start': 0.0, 'end': 1.0}, {'word': ' world', 'start': 1.0, 'end': 2.0}]}
+    """
+    start = float(segment['start'])
+    end = float(segment['end'])
+    text = segment['text']
+    words = [{'word': word['word'], 'start': float(word['start']), 'end': float(word['end'])}
+             for word in segment.get('words') or []]
+
+    if "".join(word['word'] for word in words).strip() != text.strip():
+        tokens = text.split()
+        step = (end - start) / max(len(tokens), 1)
+        words = [{'word': f" {token}", 'start': start + i * step, 'end': start + (i + 1) * step}
+                 for i, token in enumerate(tokens)]
+
+    return {'start': start, 'end': end, 'text': text, 'words': words}
+
+
+def normalize_term(word: str) -> str:
+    """
+    Turn a transcript word into the form it is indexed and searched under.
+
+    Args:
+        word (str): The word as transcribed, e.g. ' Hello,'.
+
+    Returns:
+        str: The lowercased word without punctuation, or an empty string if nothing is left.
+
+    Example:
+        >>> normalize_term(" Don't,")
+        "don't"
+    """
+    return "".join(re.findall(r"[\w']+", word.lower())).strip("'")
+
+
+def tokenize_query(query: str) -> list:
+    """
+    Split a search phrase into indexed terms.
+
+    Args:
+        query (str): The phrase to search for.
+
+    Returns:
+        list: The normalized terms, in order.
+
+    Example:
+        >>> tokenize_query("Hello, World!")
+        ['hello', 'world']
+    """
+    return [term for term in (normalize_term(word) for word in query.split()) if term]
+
+
+def format_timestamp(ms: int, separator: str = ",") -> str:
+    """
+    Format a time in milliseconds as a subtitle timestamp.
+
+    Args:
+        ms (int): The time in milliseconds.
+        separator (str): The separator before the milliseconds: ',' for SRT, '.' for WebVTT.
+
+    Returns:
+        str: The timestamp.
+
+    Example:
+        >>> format_timestamp(10500)
+        '00:00:10,500'
+    """
+    seconds, milliseconds = divmod(int(ms), 1000)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def _to_ms(seconds: float) -> int:
+    return max(int(round(seconds * 1000)), 0)
+
+
+def _build_string_table(strings: list) -> tuple:
+    blob = bytearray()
+    offsets = [0]
+    for string in strings:
+        blob += string.encode('utf-8')
+        offsets.append(len(blob))
+    return np.asarray(offsets, dtype=np.uint32), np.frombuffer(bytes(blob), dtype=np.uint8)
+
+
+def _write_sections(path: str, magic: bytes, sections: list):
+    """
+    Write arrays to a file as a header of section sizes followed by the raw sections, each padded to 4 bytes.
+
+    Every section then starts 4-byte aligned, so uint32 sections can be viewed straight out of a memory map.
+    Like the header, uint32 sections are written little-endian whatever the machine; byte sections stay as is.
+    """
+    payloads = [np.ascontiguousarray(section, dtype=np.uint8 if section.dtype == np.uint8 else '<u4').tobytes()
+                for section in sections]
+    with open(path, 'wb') as file:
+        file.write(magic)
+        file.write(struct.pack(f"<{2 + len(payloads)}I", FORMAT_VERSION, len(payloads),
+                               *(len(payload) for payload in payloads)))
+        for payload in payloads:
+            file.write(payload)
+            file.write(b"\0" * (-len(payload) % 4))
+
+
+def _read_sections(path: str, magic: bytes, mmap: bool) -> list:
+    """
+    Read the sections written by _write_sections as uint8 arrays, memory mapped unless mmap is False.
+    """
+    data = np.memmap(path, dtype=np.uint8, mode='r') if mmap else np.fromfile(path, dtype=np.uint8)
+    if bytes(data[:4]) != magic:
+        raise ValueError(f"{path} is not a {magic.decode()} file")
+    version, count = struct.unpack("<2I", bytes(data[4:12]))
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported {magic.decode()} version {version} in {path}")
+    sizes = struct.unpack(f"<{count}I", bytes(data[12:12 + 4 * count]))
+
+    sections = []
+    offset = 12 + 4 * count
+    for size in sizes:
+        sections.append(data[offset:offset + size])
+        offset += size + (-size % 4)
+    return sections
+
+
+class WordTimeline:
+    """
+    Column-oriented word timeline of a transcript.
+
+    Every word is a row of the start_ms, end_ms and string_id columns, where string_id points into a
+    deduplicated UTF-8 string table. Segments are runs of words given by segment_offsets. All columns are
+    uint32 arrays, saved little-endian, so a saved timeline can be memory mapped and read without parsing.
+
+    Attributes:
+        start_ms (np.ndarray): When each word starts, in milliseconds.
+        end_ms (np.ndarray): When each word ends, in milliseconds.
+        string_ids (np.ndarray): The string table entry of each word.
+        segment_offsets (np.ndarray): The index of the first word of each segment, followed by the word count.
+        segment_start_ms (np.ndarray): When each segment starts, in milliseconds.
+        segment_end_ms (np.ndarray): When each segment ends, in milliseconds.
+        string_offsets (np.ndarray): The byte offset of each string in strings, followed by its length.
+        strings (np.ndarray): The UTF-8 bytes of all strings.
+    """
+
+    def __init__(self, start_ms, end_ms, string_ids, segment_offsets, segment_start_ms, segment_end_ms,
+                 string_offsets, strings):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.string_ids = string_ids
+        self.segment_offsets = segment_offsets
+        self.segment_start_ms = segment_start_ms
+        self.segment_end_ms = segment_end_ms
+        self.string_offsets = string_offsets
+        self.strings = strings
+
+    @classmethod
+    def from_segments(cls, segments: list) -> "WordTimeline":
+        """
+        Build a timeline from transcript segments, as produced by Whisper with word_timestamps=True.
+
+        Args:
+            segments (list): The transcript segments.
+
+        Returns:
+            WordTimeline: The timeline.
+
+        Example:
+            >>> timeline = WordTimeline.from_segments(transcription['segments'])
+        """
+        string_ids = {}
+        start_ms, end_ms, word_ids = [], [], []
+        segment_offsets, segment_start_ms, segment_end_ms = [0], [], []
+        for segment in map(normalize_segment, segments):
+            for word in segment['words']:
+                start_ms.append(_to_ms(word['start']))
+                end_ms.append(_to_ms(word['end']))
+                word_ids.append(string_ids.setdefault(word['word'], len(string_ids)))
+            segment_offsets.append(len(word_ids))
+            segment_start_ms.append(_to_ms(segment['start']))
+            segment_end_ms.append(_to_ms(segment['end']))
+
+        string_offsets, strings = _build_string_table(list(string_ids))
+        return cls(np.asarray(start_ms, dtype=np.uint32), np.asarray(end_ms, dtype=np.uint32),
+                   np.asarray(word_ids, dtype=np.uint32), np.asarray(segment_offsets, dtype=np.uint32),
+                   np.asarray(segment_start_ms, dtype=np.uint32), np.asarray(segment_end_ms, dtype=np.uint32),
+                   string_offsets, strings)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "WordTimeline":
+        """
+        Load a timeline saved with save, memory mapping its columns by default.
+
+        Args:
+            path (str): The path to the timeline file.
+            mmap (bool): Whether to memory map the file instead of reading it into memory.
+
+        Returns:
+            WordTimeline: The timeline.
+
+        Raises:
+            ValueError: If the file is not a timeline of a supported version.
+
+        Example:
+            >>> timeline = WordTimeline.load('path/to/words.bin')
+        """
+        sections = _read_sections(path, TIMELINE_MAGIC, mmap)
+        *columns, strings = sections
+        return cls(*(column.view('<u4') for column in columns), strings)
+
+    def save(self, path: str):
+        """
+        Save the timeline in its binary column format.
+
+        Args:
+            path (str): The path to write to.
+
+        Example:
+            >>> timeline.save('path/to/words.bin')
+        """
+        _write_sections(path, TIMELINE_MAGIC, [
+            self.start_ms, self.end_ms, self.string_ids, self.segment_offsets,
+            self.segment_start_ms, self.segment_end_ms, self.string_offsets, self.strings
+        ])
+
+    def __len__(self) -> int:
+        return len(self.start_ms)
+
+    def string(self, string_id: int) -> str:
+        """
+        Get an entry of the string table.
+
+        Args:
+            string_id (int): The index of the string.
+
+        Returns:
+            str: The string.
+        """
+        return bytes(self.strings[self.string_offsets[string_id]:self.string_offsets[string_id + 1]]).decode('utf-8')
+
+    def word(self, position: int) -> str:
+        """
+        Get the text of a word, including its leading space.
+
+        Args:
+            position (int): The index of the word in the timeline.
+
+        Returns:
+            str: The word.
+        """
+        return self.string(self.string_ids[position])
+
+    def iter_segments(self):
+        """
+        Yield the segments one at a time, without materializing the whole transcript.
+
+        Yields:
+            dict: The segment with 'start', 'end', 'text' and 'words', times in seconds.
+
+        Example:
+            >>> for segment in timeline.iter_segments():
+            ...     print(segment['text'])
+        """
+        for i in range(len(self.segment_start_ms)):
+            words = [{'word': self.word(position), 'start': self.start_ms[position] / 1000,
+                      'end': self.end_ms[position] / 1000}
+                     for position in range(self.segment_offsets[i], self.segment_offsets[i + 1])]
+            yield {'start': self.segment_start_ms[i] / 1000, 'end': self.segment_end_ms[i] / 1000,
+                   'text': "".join(word['word'] for word in words), 'words': words}
+
+
+def write_srt(timeline: WordTimeline, file):
+    """
+    Stream a timeline to a file as SubRip subtitles, one cue at a time.
+
+    Args:
+        timeline (WordTimeline): The timeline to write.
+        file (TextIO): The file to write to.
+
+    Example:
+        >>> with open('captions.srt', 'w') as file:
+        ...     write_srt(timeline, file)
+    """
+    for i, segment in enumerate(timeline.iter_segments()):
+        file.write(f"{i + 1}\n"
+                   f"{format_timestamp(timeline.segment_start_ms[i])} --> {format_timestamp(timeline.segment_end_ms[i])}\n"
+                   f"{segment['text'].strip()}\n\n")
+
+
+def write_vtt(timeline: WordTimeline, file):
+    """
+    Stream a timeline to a file as WebVTT subtitles, one cue at a time.
+
+    Args:
+        timeline (WordTimeline): The timeline to write.
+        file (TextIO): The file to write to.
+
+    Example:
+        >>> with open('captions.vtt', 'w') as file:
+        ...     write_vtt(timeline, file)
+    """
+    file.write("WEBVTT\n\n")
+    for i, segment in enumerate(timeline.iter_segments()):
+        file.write(f"{format_timestamp(timeline.segment_start_ms[i], '.')} --> "
+                   f"{format_timestamp(timeline.segment_end_ms[i], '.')}\n"
+                   f"{segment['text'].strip()}\n\n")
+
+
+def write_json(timeline: WordTimeline, file):
+    """
+    Stream a timeline to a file as JSON of the form {"segments": [...]}, one segment at a time.
+
+    Args:
+        timeline (WordTimeline): The timeline to write.
+        file (TextIO): The file to write to.
+
+    Example:
+        >>> with open('words.json', 'w') as file:
+        ...     write_json(timeline, file)
+    """
+    file.write('{"segments": [')
+    for i, segment in enumerate(timeline.iter_segments()):
+        if i:
+            file.write(", ")
+        file.write(json.dumps(segment))
+    file.write("]}\n")
+
+
+class InvertedIndex:
+    """
+    Inverted index of the words of a timeline.
+
+    Terms are stored sorted in a string table. The postings of term i are rows
+    posting_offsets[i]:posting_offsets[i + 1] of postings, each row holding the word position, start_ms and
+    end_ms, so a phrase can be located and timestamped without reading the timeline.
+
+    Attributes:
+        term_offsets (np.ndarray): The byte offset of each term in terms, followed by its length.
+        terms (np.ndarray): The UTF-8 bytes of the sorted terms.
+        posting_offsets (np.ndarray): The first postings row of each term, followed by the row count.
+        postings (np.ndarray): An (n, 3) uint32 array of (position, start_ms, end_ms) rows.
+    """
+
+    def __init__(self, term_offsets, terms, posting_offsets, postings):
+        self.term_offsets = term_offsets
+        self.terms = terms
+        self.posting_offsets = posting_offsets
+        self.postings = postings
+
+    @classmethod
+    def from_timeline(cls, timeline: WordTimeline) -> "InvertedIndex":
+        """
+        Index every word of a timeline under its normalized term.
+
+        Args:
+            timeline (WordTimeline): The timeline to index.
+
+        Returns:
+            InvertedIndex: The index.
+
+        Example:
+            >>> index = InvertedIndex.from_timeline(timeline)
+        """
+        string_terms = [normalize_term(timeline.string(i)) for i in range(len(timeline.string_offsets) - 1)]
+        word_terms = [string_terms[string_id] for string_id in timeline.string_ids]
+        positions = sorted((position for position, term in enumerate(word_terms) if term),
+                           key=lambda position: word_terms[position])
+
+        terms, posting_offsets = [], []
+        for row, position in enumerate(positions):
+            if not terms or terms[-1] != word_terms[position]:
+                terms.append(word_terms[position])
+                posting_offsets.append(row)
+        posting_offsets.append(len(positions))
+
+        positions = np.asarray(positions, dtype=np.uint32)
+        postings = np.stack([positions, timeline.start_ms[positions], timeline.end_ms[positions]], axis=1)
+        term_offsets, term_bytes = _build_string_table(terms)
+        return cls(term_offsets, term_bytes, np.asarray(posting_offsets, dtype=np.uint32),
+                   postings.astype(np.uint32).reshape(-1, 3))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "InvertedIndex":
+        """
+        Load an index saved with save, memory mapping it by default.
+
+        Args:
+            path (str): The path to the index file.
+            mmap (bool): Whether to memory map the file instead of reading it into memory.
+
+        Returns:
+            InvertedIndex: The index.
+
+        Raises:
+            ValueError: If the file is not an index of a supported version.
+
+        Example:
+            >>> index = InvertedIndex.load('path/to/index.bin')
+        """
+        term_offsets, terms, posting_offsets, postings = _read_sections(path, INDEX_MAGIC, mmap)
+        return cls(term_offsets.view('<u4'), terms, posting_offsets.view('<u4'),
+                   postings.view('<u4').reshape(-1, 3))
+
+    def save(self, path: str):
+        """
+        Save the index in its binary format.
+
+        Args:
+            path (str): The path to write to.
+
+        Example:
+            >>> index.save('path/to/index.bin')
+        """
+        _write_sections(path, INDEX_MAGIC, [self.term_offsets, self.terms, self.posting_offsets, self.postings])
+
+    def __len__(self) -> int:
+        return len(self.term_offsets) - 1
+
+    def term(self, i: int) -> str:
+        """
+        Get the i-th term in sorted order.
+        """
+        return bytes(self.terms[self.term_offsets[i]:self.term_offsets[i + 1]]).decode('utf-8')
+
+    def items(self):
+        """
+        Yield every term with its postings, in sorted order.
+
+        Yields:
+            tuple: The term and its (n, 3) array of (position, start_ms, end_ms) rows.
+        """
+        for i in range(len(self)):
+            yield self.term(i), self.postings[self.posting_offsets[i]:self.posting_offsets[i + 1]]
+
+    def get(self, term: str) -> np.ndarray:
+        """
+        Look up the postings of a term by binary search over the sorted terms.
+
+        Args:
+            term (str): The normalized term.
+
+        Returns:
+            np.ndarray: The (n, 3) array of (position, start_ms, end_ms) rows, empty if the term is not indexed.
+
+        Example:
+            >>> index.get('hello')
+            array([[ 12, 4020, 4380]], dtype=uint32)
+        """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self.term(low) == term:
+            return self.postings[self.posting_offsets[low]:self.posting_offsets[low + 1]]
+        return np.empty((0, 3), dtype=np.uint32)
+
+
+def encode_postings(postings: np.ndarray) -> bytes:
+    """
+    Pack postings into bytes for storage outside the index file, e.g. in Redis.
+
+    Args:
+        postings (np.ndarray): An (n, 3) array of (position, start_ms, end_ms) rows.
+
+    Returns:
+        bytes: The rows as little-endian uint32s.
+
+    Example:
+        >>> encode_postings(index.get('hello'))
+        b'\x0c\x00\x00\x00\xb4\x0f\x00\x00\x1c\x11\x00\x00'
+    """
+    return np.ascontiguousarray(postings, dtype='<u4').tobytes()
+
+
+def decode_postings(data: bytes) -> np.ndarray:
+    """
+    Unpack postings packed with encode_postings.
+
+    Args:
+        data (bytes): The packed postings.
+
+    Returns:
+        np.ndarray: An (n, 3) uint32 array of (position, start_ms, end_ms) rows.
+
+    Example:
+        >>> decode_postings(b'\x0c\x00\x00\x00\xb4\x0f\x00\x00\x1c\x11\x00\x00')
+        array([[  12, 4020, 4380]], dtype=uint32)
+    """
+    return np.frombuffer(data, dtype='<u4').reshape(-1, 3)
+
+
+def find_phrase(postings: list) -> list:
+    """
+    Find where consecutive terms occur next to each other, given the postings of each term in phrase order.
+
+    Args:
+        postings (list): The (n, 3) (position, start_ms, end_ms) arrays of each term of the phrase.
+
+    Returns:
+        list: (start_ms, end_ms) tuples, one per occurrence of the phrase, in order.
+
+    Example:
+        >>> find_phrase([index.get('hello'), index.get('world')])
+        [(4020, 4710)]
+    """
+    if not postings or any(len(rows) == 0 for rows in postings):
+        return []
+
+    starts = postings[0][:, 0].astype(np.int64)
+    matches = np.ones(len(starts), dtype=bool)
+    for offset, rows in enumerate(postings[1:], start=1):
+        matches &= np.isin(starts + offset, rows[:, 0])
+
+    last = postings[-1]
+    last_end = dict(zip(last[:, 0].tolist(), last[:, 2].tolist()))
+    return [(int(start_ms), last_end[position + len(postings) - 1])
+            for position, start_ms in zip(starts[matches].tolist(), postings[0][matches, 1].tolist())]